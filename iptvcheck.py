@@ -4,8 +4,11 @@
 # GNU AGPLv3 许可证可在本仓库根目录的 LICENSE 文件中找到
 
 
-import os, requests, argparse, logging, concurrent.futures, subprocess, time, signal, sys, threading, urllib3, shutil
-from typing import Tuple, Optional
+import os, re, contextlib, functools, requests, argparse, logging, concurrent.futures, subprocess, time, signal, ssl, sys, threading, urllib3, shutil
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, Tuple, Optional
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from colorama import Fore, Style, init
 
@@ -15,6 +18,29 @@ RETRY_COUNT = 1
 SKIPPED_FILE_PATH = 'other/skipped.txt'
 FFMPEG_TIMEOUT = 25
 NUM_THREADS = 4  # Change to the required number of threads
+FFMPEG_TIMEOUT_ERROR = "ffmpeg timeout"
+
+# Reason codes of a check result, named after the Stats counter they increment
+WORKING = 'working'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+
+# (success, error, reason_code)
+CheckResult = Tuple[bool, Optional[str], str]
+HTTP_POOL_SIZE = 32
+PLAYLIST_CHUNK_SIZE = 1 << 16  # Bytes read at a time when streaming a playlist download
+OUTPUT_BUFFER_SIZE = 1 << 20  # Write buffer for saved playlists
+SKIPPED_BUFFER_SIZE = 1 << 16  # Write buffer for the skipped channels file
+HTTP_CHECK_THREADS = HTTP_POOL_SIZE  # HTTP pre-checks are I/O-bound and can run much wider than ffmpeg
+HTTP_INFLIGHT_LIMIT = 2 * HTTP_CHECK_THREADS  # HTTP checks submitted but not yet collected
+SNIFF_BYTES = 2048
+HTTP_OK_STATUSES = (200, 206)  # 206 is the answer to a ranged GET
+CACHE_SIZE = 4096  # Maximum number of URLs whose check results are kept
+DEFAULT_USER_AGENT = 'VLC/3.0.20 LibVLC/3.0.20'
+
+# Line prefixes recognized by the playlist parser
+_URL_PREFIXES = ('http://', 'https://', 'rtmp://', 'rtsp://', 'mms://', 'udp://')
+_OPT_PREFIXES = ('#EXTVLCOPT:', '#KODIPROP:', '#EXTGRP:', '#EXTLOGO:')
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -25,6 +51,53 @@ init(autoreset=True)
 logging.basicConfig(filename='iptv_check.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+class UnverifiedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools share one SSL context that skips certificate checks.
+
+    IPTV hosts often have broken certificates, and reusing a single context avoids building
+    a new one for every connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # A bare client context: create_default_context() would load the system CA store,
+        # which goes unused since certificates are never verified
+        self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        # Session.verify = False alone is overridden by REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE
+        kwargs['verify'] = False
+        return super().send(request, **kwargs)
+
+
+def create_session() -> requests.Session:
+    """Create an HTTP session whose keep-alive connections are pooled per host."""
+    session = requests.Session()
+    session.verify = False
+    adapter = UnverifiedHTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                    pool_block=False, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = DEFAULT_USER_AGENT
+    return session
+
+
+# Shared HTTP session so channels on the same host reuse pooled keep-alive connections
+SESSION = create_session()
+
+
+def init_probe_worker():
+    """Give each ffmpeg worker process its own session instead of sockets inherited from the parent."""
+    global SESSION
+    SESSION = create_session()
+
+
 # Channel statistics using the class
 class Stats:
     def __init__(self):
@@ -40,6 +113,10 @@ class Stats:
         self.timeout = 0
         self.skipped = 0
 
+    def record(self, reason_code: str):
+        """Count one checked channel by its reason code (WORKING, FAILED or TIMEOUT)."""
+        setattr(self, reason_code, getattr(self, reason_code) + 1)
+
     def log_summary(self):
         total = self.working + self.failed + self.timeout + self.skipped
         logging.info("=== 统计摘要 ===")
@@ -66,7 +143,6 @@ class Stats:
 
 stats = Stats()
 os.makedirs(os.path.dirname(SKIPPED_FILE_PATH), exist_ok=True)
-lock = threading.Lock()
 
 
 def signal_handler(sig, frame):
@@ -99,72 +175,262 @@ def check_dependencies():
         sys.exit(1)
 
 
-# Cache for storing test results
-cache = {}
+# Cache for storing test results, bounded as an LRU to cap memory on huge playlists
+_cache = OrderedDict()
+# URLs with an HTTP check in progress, so concurrent duplicates wait instead of re-checking
+_inflight = {}
+_cache_lock = threading.Lock()
+
 
+def get_cached_result(url: str) -> Optional[CheckResult]:
+    """Return the cached (success, error, reason_code) result for a URL, or None if it has not been checked."""
+    with _cache_lock:
+        result = _cache.get(url)
+        if result is not None:
+            _cache.move_to_end(url)
+        return result
 
-def parse_playlist(content: str) -> list:
-    """Parse playlist content into a structured format handling various M3U extensions."""
-    lines = content.splitlines()
-    channels = []
+
+def cache_result(url: str, result: CheckResult):
+    """Store a check result, evicting the least recently used URL when the cache is full."""
+    with _cache_lock:
+        _cache[url] = result
+        _cache.move_to_end(url)
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def parse_playlist_iter(lines) -> Iterator[dict]:
+    """Parse playlist lines into channel dicts as they arrive, handling various M3U extensions.
+
+    A channel is yielded once the next #EXTINF line or the end of input shows it is complete.
+    Plain line iteration is deliberate: a single re.finditer tokenizer over the whole content
+    measured slower, and would need the full playlist in memory.
+    """
     current_channel = None
+    current_options = None
     
     for line in lines:
-        line = line.strip()
-        
-        if not line or line == "#EXTM3U":
+        line = line.rstrip()
+        if not line:
             continue
-            
-        if line.startswith("#EXTINF:"):
-            # Start a new channel entry
-            current_channel = {
-                'extinf': line,
-                'url': None,
-                'options': []
-            }
-            channels.append(current_channel)
-            
-        elif line.startswith(("#EXTVLCOPT:", "#KODIPROP:", "#EXTGRP:", "#EXTLOGO:")):
-            # Store additional directives
-            if current_channel:
-                current_channel['options'].append(line)
+        if line[0].isspace():
+            line = line.lstrip()
+
+        # Dispatch on the first character so URL lines skip the directive checks and vice versa
+        if line[0] == '#':
+            if line.startswith("#EXTINF:"):
+                # Skip channels without URLs
+                if current_channel and current_channel['url']:
+                    yield current_channel
+                # Start a new channel entry
+                current_options = []
+                # The channel name follows the first comma of the EXTINF line
+                _, sep, name = line.partition(',')
+                current_channel = {
+                    'extinf': line,
+                    'name': name.strip() if sep else "Unknown",
+                    'url': None,
+                    'options': current_options
+                }
                 
-        elif line.startswith("http://") or line.startswith("https://") or line.startswith("rtmp://") or \
-             line.startswith("rtsp://") or line.startswith("mms://") or line.startswith("udp://"):
+            elif current_channel and line.startswith(_OPT_PREFIXES):
+                # Store additional directives
+                current_options.append(line)
+                
+        elif current_channel and line.startswith(_URL_PREFIXES):
             # This is a URL
-            if current_channel:
-                current_channel['url'] = line
+            current_channel['url'] = line
     
-    # Filter out channels without URLs
-    return [ch for ch in channels if ch['url']]
+    if current_channel and current_channel['url']:
+        yield current_channel
+
+
+def _iter_download_lines(response: requests.Response) -> Iterator[str]:
+    """Yield the lines of a streamed playlist download, stopping early if the connection fails.
+
+    Channels parsed before the failure are still checked and saved.
+    """
+    try:
+        yield from response.iter_lines(chunk_size=PLAYLIST_CHUNK_SIZE, decode_unicode=True)
+    except requests.RequestException as e:
+        logging.error(f"Playlist download interrupted: {e}")
+        print(f"{Fore.RED}Playlist download interrupted, checking the channels read so far: {e}{Style.RESET_ALL}")
+
+
+@contextlib.contextmanager
+def open_playlist(playlist: str):
+    """Yield the lines of a playlist URL or file, streamed instead of read into memory first."""
+    if playlist.startswith('http'):
+        try:
+            response = SESSION.get(playlist, stream=True, timeout=30)
+        except requests.RequestException as e:
+            logging.error(f"Failed to download playlist: {e}")
+            sys.exit(1)
+        # Without a declared charset iter_lines would yield undecoded bytes
+        response.encoding = response.encoding or 'utf-8'
+        with contextlib.closing(response):
+            yield _iter_download_lines(response)
+    else:
+        try:
+            f = open(playlist, 'r', encoding='utf-8', errors='ignore')
+        except FileNotFoundError:
+            logging.error(f"File {playlist} not found")
+            sys.exit(1)
+        except IOError as e:
+            logging.error(f"Error reading file {playlist}: {e}")
+            sys.exit(1)
+        with f:
+            yield f
+
+
+def is_stream_payload(content_type: str, chunk: bytes) -> bool:
+    """Recognize an HLS manifest or MPEG-TS data from the first bytes of a response."""
+    # Many manifests are served from URLs without a .m3u8 suffix (e.g. .php or /live)
+    if chunk.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U'):
+        return True
+    # MPEG-TS packets are 188 bytes long and each starts with the 0x47 sync byte
+    if len(chunk) >= 188 and all(chunk[i] == 0x47 for i in range(0, len(chunk) - 187, 188)):
+        return True
+    return content_type.startswith(('video/', 'application/vnd.apple.mpegurl',
+                                    'application/x-mpegurl', 'audio/mpegurl'))
+
+
+def fetch_stream_start(url: str, headers: Optional[dict] = None) -> Tuple[int, str, bytes]:
+    """Fetch the status and first bytes of an HTTP(S) stream in a single round trip.
+
+    Returns (status_code, content_type, chunk); the chunk is empty unless the status is OK.
+    Many IPTV servers don't support HEAD requests, so a ranged GET is used instead.
+    """
+    request_headers = dict(headers) if headers else {}
+    request_headers['Range'] = f'bytes=0-{SNIFF_BYTES - 1}'
+    response = SESSION.get(url, headers=request_headers, timeout=10, stream=True, allow_redirects=True)
+    try:
+        if response.status_code not in HTTP_OK_STATUSES:
+            return response.status_code, '', b''
+        chunk = response.raw.read(SNIFF_BYTES, decode_content=True)
+        return response.status_code, response.headers.get('Content-Type', '').lower(), chunk
+    finally:
+        response.close()  # Close stream immediately to avoid downloading too much data
 
 
-def check_stream(url: str, channel_name: str, headers: Optional[dict] = None, ffmpeg_timeout: int = FFMPEG_TIMEOUT) -> Tuple[bool, Optional[str]]:
-    """Validate stream against URL using ffmpeg and HTTP request. Returns a tuple (success, error) for logging."""
-    if url in cache:
-        return cache[url]
+def sniff_stream(url: str, headers: Optional[dict] = None) -> bool:
+    """Check an HTTP(S) stream in-process. Returns True if the response is recognizably a stream."""
+    try:
+        status_code, content_type, chunk = fetch_stream_start(url, headers)
+        return status_code in HTTP_OK_STATUSES and is_stream_payload(content_type, chunk)
+    except Exception as e:
+        # Anything unexpected (e.g. non-latin-1 header values) is left for ffmpeg to judge
+        logging.debug("HTTP sniff failed for %s: %s", url, e)
+        return False
+
+
+def http_precheck(url: str, headers: Optional[dict] = None) -> bool:
+    """Confirm an HTTP(S) stream without ffmpeg. Returns False if ffmpeg still has to check it."""
+    with _cache_lock:
+        result = _cache.get(url)
+        event = _inflight.get(url) if result is None else None
+        is_owner = result is None and event is None
+        if is_owner:
+            event = _inflight[url] = threading.Event()
+
+    if result is not None:
+        return result[0]
+
+    if not is_owner:
+        # Another worker is checking the same URL; reuse its result
+        event.wait()
+        result = get_cached_result(url)
+        return result is not None and result[0]
 
+    try:
+        if sniff_stream(url, headers):
+            cache_result(url, (True, None, WORKING))
+            return True
+        return False
+    finally:
+        with _cache_lock:
+            del _inflight[url]
+        event.set()
+
+
+@functools.lru_cache(maxsize=None)
+def _executable(name: str) -> str:
+    """Resolve an external tool to its absolute path once instead of on every run."""
+    return shutil.which(name) or name
+
+
+def _run_tool(command: list, **kwargs) -> subprocess.CompletedProcess:
+    """Run ffmpeg or ffprobe in a way that lets CPython use posix_spawn instead of fork+exec.
+
+    That path needs an absolute executable and close_fds=False. Descriptors opened by Python are
+    non-inheritable anyway, so the tool still only receives its standard streams.
+    """
+    return subprocess.run([_executable(command[0])] + command[1:], close_fds=False, **kwargs)
+
+
+@functools.lru_cache(maxsize=256)
+def _format_ffmpeg_headers(items: tuple) -> Tuple[str, Optional[str]]:
+    """Format sorted header items for ffmpeg/ffprobe. Returns (header_str, user_agent).
+
+    Cached because the same User-Agent/Referer combination usually recurs across many channels.
+    """
+    user_agent = None
+    header_str = ""
+    for key, value in items:
+        if key == 'User-Agent':
+            user_agent = value
+        elif key and value:  # Include Referer in header string
+            # Convert header name to Title-Case for consistency
+            formatted_key = '-'.join(word.capitalize() for word in key.split('-'))
+            header_str += f"{formatted_key}: {value}\r\n"
+    return header_str, user_agent
+
+
+def _ffmpeg_header_args(headers: Optional[dict] = None) -> list:
+    """Build the -user_agent and -headers options shared by ffmpeg and ffprobe."""
+    header_str, user_agent = _format_ffmpeg_headers(tuple(sorted(headers.items())) if headers else ())
+    args = []
+    if user_agent is not None:
+        args.extend(['-user_agent', user_agent])
+    # Only add headers parameter if we have headers to add
+    if header_str:
+        args.extend(['-headers', header_str])
+    return args
+
+
+def _ffmpeg_input_args(url: str, headers: Optional[dict] = None) -> list:
+    """Build the ffmpeg input options (headers, reconnect settings and -i) for one stream."""
+    args = _ffmpeg_header_args(headers)
+    args.extend([
+        '-reconnect', '1',
+        '-reconnect_streamed', '1',
+        '-reconnect_delay_max', '5',
+        '-i', url
+    ])
+    return args
+
+
+def _ffmpeg_probe(url: str, channel_name: str, headers: Optional[dict] = None, ffmpeg_timeout: int = FFMPEG_TIMEOUT) -> CheckResult:
+    """Validate stream against URL using ffmpeg and HTTP request. Returns a tuple (success, error, reason_code).
+
+    Runs in a worker process, so it must not touch the shared stats or cache.
+    """
     for attempt in range(RETRY_COUNT + 1):
         try:
-            logging.debug(f"Checking stream: {channel_name} ({url}) with headers: {headers}) - Attempt {attempt + 1}")
+            logging.debug("Checking stream: %s (%s) with headers: %s - Attempt %d", channel_name, url, headers, attempt + 1)
 
             # First check with direct HTTP request
             http_success = False
             if url.startswith('http://') or url.startswith('https://'):
                 try:
-                    response = requests.head(url, headers=headers, timeout=15, verify=False)
-                    if response.status_code == 200:
+                    status_code, _, _ = fetch_stream_start(url, headers)
+                    if status_code in HTTP_OK_STATUSES:
                         http_success = True
                     else:
-                        # Some IPTV servers don't support HEAD requests, try GET instead
-                        response = requests.get(url, headers=headers, timeout=15, verify=False, stream=True)
-                        response.close()  # Close stream immediately to avoid downloading too much data
-                        if response.status_code == 200:
-                            http_success = True
-                        else:
-                            logging.warning(f"HTTP request failed for {channel_name} with status code: {response.status_code}")
-                except requests.RequestException as e:
-                    logging.warning(f"HTTP request failed for {channel_name}: {e}")
+                        logging.warning("HTTP request failed for %s with status code: %s", channel_name, status_code)
+                except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                    logging.warning("HTTP request failed for %s: %s", channel_name, e)
             
             # If HTTP check passed, try a more lenient ffmpeg test
             if http_success:
@@ -173,70 +439,30 @@ def check_stream(url: str, channel_name: str, headers: Optional[dict] = None, ff
                 ffmpeg_timeout_reduced = ffmpeg_timeout
 
             # Build ffmpeg command with all necessary headers
-            ffmpeg_command = ['ffmpeg']
-            
-            # Add headers to ffmpeg correctly
-            if headers:
-                # Add user agent if present
-                if 'User-Agent' in headers:
-                    ffmpeg_command.extend(['-user_agent', headers['User-Agent']])
-                
-                # Build headers string for other headers
-                header_str = ""
-                for key, value in headers.items():
-                    if key not in ['User-Agent'] and key and value:  # Include Referer in header string
-                        # Convert header name to Title-Case for consistency
-                        formatted_key = '-'.join(word.capitalize() for word in key.split('-'))
-                        header_str += f"{formatted_key}: {value}\r\n"
-                
-                # Only add headers parameter if we have headers to add
-                if header_str:
-                    ffmpeg_command.extend(['-headers', header_str])
-            
-            # Add quiet mode to reduce noise and add stream URL
+            ffmpeg_command = ['ffmpeg', '-loglevel', 'warning']
+            ffmpeg_command.extend(_ffmpeg_input_args(url, headers))
             ffmpeg_command.extend([
-                '-loglevel', 'warning',
-                '-reconnect', '1',
-                '-reconnect_streamed', '1',
-                '-reconnect_delay_max', '5',
-                '-i', url,
                 '-t', '3',  # Just check first 3 seconds
                 '-f', 'null', 
                 '-'
             ])
             
-            logging.debug(f"Running ffmpeg command: {' '.join(ffmpeg_command)}")
-            result = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=ffmpeg_timeout_reduced)
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug("Running ffmpeg command: %s", ' '.join(ffmpeg_command))
+            result = _run_tool(ffmpeg_command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=ffmpeg_timeout_reduced)
             
             if result.returncode == 0:
-                stats.working += 1
-                cache[url] = (True, None)
-                return True, None
+                return True, None, WORKING
                 
             # First attempt failed - let's try alternative approaches
             error_output = result.stderr.decode('utf-8', errors='ignore')
-            logging.debug(f"ffmpeg error output: {error_output}")
+            logging.debug("ffmpeg error output: %s", error_output)
             
             # Try with ffprobe instead - sometimes more lenient
             if attempt == 0:
                 try:
                     ffprobe_cmd = ['ffprobe']
-                    
-                    # Add user agent if present
-                    if headers and 'User-Agent' in headers:
-                        ffprobe_cmd.extend(['-user_agent', headers['User-Agent']])
-                    
-                    # Add headers
-                    if headers:
-                        header_str = ""
-                        for key, value in headers.items():
-                            if key != 'User-Agent' and key and value:
-                                formatted_key = '-'.join(word.capitalize() for word in key.split('-'))
-                                header_str += f"{formatted_key}: {value}\r\n"
-                        
-                        if header_str:
-                            ffprobe_cmd.extend(['-headers', header_str])
-                    
+                    ffprobe_cmd.extend(_ffmpeg_header_args(headers))
                     ffprobe_cmd.extend([
                         '-v', 'error',
                         '-show_entries', 'format=duration',
@@ -244,32 +470,16 @@ def check_stream(url: str, channel_name: str, headers: Optional[dict] = None, ff
                         '-i', url
                     ])
                     
-                    probe_result = subprocess.run(ffprobe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=ffmpeg_timeout_reduced)
+                    probe_result = _run_tool(ffprobe_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=ffmpeg_timeout_reduced)
                     if probe_result.returncode == 0 or (probe_result.stdout and float(probe_result.stdout.strip() or 0) > 0):
-                        stats.working += 1
-                        cache[url] = (True, None)
-                        return True, None
+                        return True, None, WORKING
                 except Exception as e:
-                    logging.debug(f"ffprobe check failed: {e}")
+                    logging.debug("ffprobe check failed: %s", e)
                 
-                # Try curl as a last resort for HTTP streams
-                if url.startswith(('http://', 'https://')) and headers:
-                    try:
-                        curl_cmd = ['curl', '-s', '-I', '-L']
-                        
-                        # Add headers to curl
-                        for key, value in headers.items():
-                            curl_cmd.extend(['-H', f"{key}: {value}"])
-                        
-                        curl_cmd.append(url)
-                        curl_result = subprocess.run(curl_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
-                        
-                        if curl_result.returncode == 0 and b"200 OK" in curl_result.stdout:
-                            stats.working += 1
-                            cache[url] = (True, None)
-                            return True, None
-                    except Exception as e:
-                        logging.debug(f"curl check failed: {e}")
+                # Last resort for HTTP streams: ffmpeg may mishandle the channel's headers, but the
+                # HTTP check above already fetched the stream with them, so trust that result
+                if http_success and headers:
+                    return True, None, WORKING
             
             # All attempts failed - determine error reason
             error_reason = "Stream does not work"
@@ -290,31 +500,23 @@ def check_stream(url: str, channel_name: str, headers: Optional[dict] = None, ff
             
             # Only mark as failed on last retry attempt
             if attempt == RETRY_COUNT:
-                stats.failed += 1
-                cache[url] = (False, error_reason)
-                return False, error_reason
+                return False, error_reason, FAILED
 
         except subprocess.TimeoutExpired:
-            logging.error(f"ffmpeg timeout for {channel_name} (attempt {attempt + 1})")
+            logging.error("ffmpeg timeout for %s (attempt %d)", channel_name, attempt + 1)
             if attempt == RETRY_COUNT:
-                stats.timeout += 1
-                cache[url] = (False, "ffmpeg timeout")
-                return False, "ffmpeg timeout"
+                return False, FFMPEG_TIMEOUT_ERROR, TIMEOUT
 
         except requests.exceptions.RequestException as e:
-            logging.error(f"Request error for {channel_name} (attempt {attempt + 1}): {e}", exc_info=True)
+            logging.error("Request error for %s (attempt %d): %s", channel_name, attempt + 1, e, exc_info=True)
             simplified_error = simplify_error(str(e))
             if attempt == RETRY_COUNT:
-                stats.failed += 1
-                cache[url] = (False, simplified_error)
-                return False, simplified_error
+                return False, simplified_error, FAILED
 
         except Exception as e:
-            logging.error(f"General error for {channel_name}: {e}", exc_info=True)
+            logging.error("General error for %s: %s", channel_name, e, exc_info=True)
             if attempt == RETRY_COUNT:
-                stats.failed += 1
-                cache[url] = (False, "General error")
-                return False, "General error"
+                return False, "General error", FAILED
             
         # Small delay between retries
         time.sleep(2)
@@ -341,107 +543,185 @@ def get_unique_filename(directory: str, filename: str) -> str:
     return new_filename
 
 
-def add_extm3u_line(content: str) -> str:
-    return "#EXTM3U\n" + content
-
-
 def process_playlist(playlist: str, save_file: Optional[str], num_threads: int = NUM_THREADS, ffmpeg_timeout: int = FFMPEG_TIMEOUT):
     check_dependencies()
     if not save_file:
         save_file = os.path.join('output', get_unique_filename('output', 'default.m3u'))
 
-    if playlist.startswith('http'):
-        try:
-            content = requests.get(playlist).text
-        except requests.RequestException as e:
-            logging.error(f"Failed to download playlist: {e}")
-            sys.exit(1)
-    else:
-        try:
-            with open(playlist, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-        except FileNotFoundError:
-            logging.error(f"File {playlist} not found")
-            sys.exit(1)
-        except IOError as e:
-            logging.error(f"Error reading file {playlist}: {e}")
-            sys.exit(1)
-
-    # Make sure content has the #EXTM3U header
-    if not content.strip().startswith("#EXTM3U"):
-        content = "#EXTM3U\n" + content
-
-    # Parse the playlist content
-    channels = parse_playlist(content)
-    
-    logging.info(f"Found {len(channels)} channels in the playlist")
-    print(f"{Fore.CYAN}Found {len(channels)} channels in the playlist{Style.RESET_ALL}")
-    
     updated_lines = ["#EXTM3U"]  # Start with the M3U header
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        future_to_channel = {}
-        pbar = tqdm(total=len(channels), desc="Checking channels", ncols=100, colour="green")
+    def report_channel_result(channel, success, error, reason_code):
+        # Statistics are only updated here, on the main thread
+        stats.record(reason_code)
+        channel_name = channel['name']
+        if success:
+            # Add this channel to the updated playlist
+            updated_lines.append(channel['extinf'])
+            for option in channel['options']:
+                updated_lines.append(option)
+            updated_lines.append(channel['url'])
+            print(f"{Fore.GREEN}[SUCCESS] {channel_name}{Style.RESET_ALL}")
+        else:
+            print(f"{Fore.RED}[FAIL] {channel_name} - {error}{Style.RESET_ALL}")
+            logging.error("Failed to play %s: %s", channel['url'], error)
+
+    skipped_file = None
+
+    def skip_channel(channel, reason):
+        # Channels that could not be checked are neither kept nor counted as dead
+        nonlocal skipped_file
+        if skipped_file is None:
+            # Opened on the first skip so a clean run leaves no empty file behind;
+            # one handle then serves the rest of the run
+            skipped_file = open(SKIPPED_FILE_PATH, 'a', encoding='utf-8', buffering=SKIPPED_BUFFER_SIZE)
+        print(f"{Fore.YELLOW}[SKIPPED] {channel['name']} - {reason}{Style.RESET_ALL}")
+        stats.skipped += 1
+        skipped_file.write(channel['extinf'] + '\n')
+        for option in channel['options']:
+            skipped_file.write(option + '\n')
+        skipped_file.write(channel['url'] + '\n')
+
+    pbar = tqdm(total=0, desc="Checking channels", ncols=100, colour="green")
+    try:
+        # Stage 1: confirm HTTP(S) streams in-process with many requests in flight.
+        # Checks start while the rest of the playlist is still being read.
+        pending = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=HTTP_CHECK_THREADS) as executor:
+            future_to_channel = {}
+            channel_count = 0
+
+            def collect_http_results(futures):
+                for future in futures:
+                    channel = future_to_channel.pop(future)
+                    if future.result():
+                        report_channel_result(channel, True, None, WORKING)
+                        pbar.update(1)
+                    else:
+                        pending.append(channel)
+
+            with open_playlist(playlist) as lines:
+                for channel in parse_playlist_iter(lines):
+                    channel_count += 1
+                    pbar.total = channel_count
+
+                    # Extract headers from options
+                    channel['headers'] = extract_headers_from_options(channel['options'])
+                    if channel['url'].startswith(('http://', 'https://')):
+                        # Keep a bounded window of checks in flight instead of queueing the whole playlist
+                        if len(future_to_channel) >= HTTP_INFLIGHT_LIMIT:
+                            done, _ = concurrent.futures.wait(future_to_channel, return_when=concurrent.futures.FIRST_COMPLETED)
+                            collect_http_results(done)
+                        future = executor.submit(http_precheck, channel['url'], channel['headers'])
+                        future_to_channel[future] = channel
+                    else:
+                        pending.append(channel)
+
+            logging.info(f"Found {channel_count} channels in the playlist")
+            print(f"{Fore.CYAN}Found {channel_count} channels in the playlist{Style.RESET_ALL}")
+
+            collect_http_results(concurrent.futures.as_completed(list(future_to_channel)))
+
+        # Stage 2: fall back to ffmpeg for everything the HTTP check could not confirm.
+        # Worker processes keep the subprocess spawning and waiting off this interpreter's GIL.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_threads, initializer=init_probe_worker) as executor:
+            # Channels sharing a URL share a single probe
+            url_channels = {}
+            for channel in pending:
+                url = channel['url']
+                cached = get_cached_result(url)
+                if cached is not None:
+                    report_channel_result(channel, *cached)
+                    pbar.update(1)
+                else:
+                    url_channels.setdefault(url, []).append(channel)
 
-        # Process each channel
-        for channel in channels:
-            url = channel['url']
-            channel_name = extract_channel_name(channel['extinf'])
-            
-            # Extract headers from options
-            headers = extract_headers_from_options(channel['options'])
-                
-            future = executor.submit(check_stream, url, channel_name, headers, ffmpeg_timeout)
-            future_to_channel[future] = channel
+            future_to_url = {}
+            for url, channels_for_url in url_channels.items():
+                channel = channels_for_url[0]
+                future = executor.submit(_ffmpeg_probe, url, channel['name'], channel['headers'], ffmpeg_timeout)
+                future_to_url[future] = url
+
+            for future in concurrent.futures.as_completed(future_to_url):
+                url = future_to_url[future]
 
-        try:
-            for future in concurrent.futures.as_completed(future_to_channel):
-                channel = future_to_channel[future]
-                channel_name = extract_channel_name(channel['extinf'])
-                
                 try:
-                    success, error = future.result()
-                    if success:
-                        # Add this channel to the updated playlist
-                        updated_lines.append(channel['extinf'])
-                        for option in channel['options']:
-                            updated_lines.append(option)
-                        updated_lines.append(channel['url'])
-                        print(f"{Fore.GREEN}[SUCCESS] {channel_name}{Style.RESET_ALL}")
-                    else:
-                        print(f"{Fore.RED}[FAIL] {channel_name} - {error}{Style.RESET_ALL}")
-                        logging.error(f"Failed to play {channel['url']}: {error}")
-                except concurrent.futures.TimeoutError:
-                    with lock:
-                        print(f"{Fore.YELLOW}[SKIPPED] {channel_name} - Took too long{Style.RESET_ALL}")
-                        stats.skipped += 1
-                        with open(SKIPPED_FILE_PATH, 'a', encoding='utf-8') as f:
-                            f.write(f"{channel['extinf']}\n")
-                            for option in channel['options']:
-                                f.write(f"{option}\n")
-                            f.write(f"{channel['url']}\n")
-                pbar.update(1)
-
-        except concurrent.futures.TimeoutError:
-            print(f"{Fore.RED}Processing took too long!{Style.RESET_ALL}")
-
-        finally:
-            pbar.close()
-
-    with open(save_file, 'w', encoding='utf-8') as f:
-        for line in updated_lines:
-            f.write(line + "\n")
+                    result = future.result()
+                    cache_result(url, result)
+                    for channel in url_channels[url]:
+                        report_channel_result(channel, *result)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM kill), which fails every probe still outstanding,
+                    # including ones that never started; those streams were never checked
+                    for channel in url_channels[url]:
+                        skip_channel(channel, "Worker process died")
+                pbar.update(len(url_channels[url]))
+
+    finally:
+        pbar.close()
+        if skipped_file is not None:
+            skipped_file.close()
+
+    with open(save_file, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as f:
+        f.write('\n'.join(updated_lines))
+        f.write('\n')
 
     print(f"\n{Fore.CYAN}Playlist saved to {save_file}{Style.RESET_ALL}")
     stats.log_summary()
     stats.print_summary()
 
 
-def extract_channel_name(extinf_line: str) -> str:
-    """Extract channel name from EXTINF line."""
-    if ',' in extinf_line:
-        return extinf_line.split(',', 1)[1].strip()
-    return "Unknown"
+# Standard spelling of the header names that playlists commonly set
+_STANDARD_HEADER_NAMES = {
+    'user-agent': 'User-Agent',
+    'referer': 'Referer',
+    'referrer': 'Referer',
+    'origin': 'Origin',
+}
+
+# Header names set by generic Kodi properties
+_KODI_PROP_HEADERS = {
+    'user-agent': 'User-Agent',
+    'http-user-agent': 'User-Agent',
+    'referer': 'Referer',
+    'referrer': 'Referer',
+    'http-referer': 'Referer',
+    'http-referrer': 'Referer',
+    'origin': 'Origin',
+    'http-origin': 'Origin',
+}
+
+# Headers given as attributes on the EXTINF line (common in some playlists)
+_EXTINF_HEADER_RE = re.compile(r'(user-agent|referer|referrer|origin)=(?:"([^"]*)"|([^\s,]+))', re.I)
+
+
+def _standard_header_name(name: str) -> str:
+    """Return the standard spelling of a header name, Title-Case for unknown headers."""
+    return _STANDARD_HEADER_NAMES.get(name.lower()) or name.title()
+
+
+def _parse_vlc_header_option(headers: dict, value: str):
+    """Handle '#EXTVLCOPT:http-header=Name: value'."""
+    key, sep, value = value.partition(':')
+    if sep:
+        headers[key.strip()] = value.strip()
+
+
+def _parse_kodi_stream_headers(headers: dict, value: str):
+    """Handle '#KODIPROP:inputstream.adaptive.stream_headers=Name=value&Name=value'."""
+    for header_pair in value.split('&'):
+        key, sep, value = header_pair.partition('=')
+        if sep:
+            headers[_standard_header_name(key.strip())] = value.strip()
+
+
+# Options matched exactly up to and including the first '=': either a header name or a handler
+_HEADER_PREFIX_HANDLERS = {
+    '#EXTVLCOPT:http-user-agent=': 'User-Agent',
+    '#EXTVLCOPT:http-referrer=': 'Referer',
+    '#EXTVLCOPT:http-origin=': 'Origin',
+    '#EXTVLCOPT:http-header=': _parse_vlc_header_option,
+    '#KODIPROP:inputstream.adaptive.stream_headers=': _parse_kodi_stream_headers,
+}
 
 
 def extract_headers_from_options(options: list) -> dict:
@@ -449,136 +729,46 @@ def extract_headers_from_options(options: list) -> dict:
     headers = {}
     
     for option in options:
-        option_lower = option.lower()
-        
-        # VLC options (most common)
-        if option.startswith('#EXTVLCOPT:http-user-agent='):
-            headers['User-Agent'] = option[27:].strip()
-        elif option.startswith('#EXTVLCOPT:http-referrer='):
-            headers['Referer'] = option[25:].strip()
-        elif option.startswith('#EXTVLCOPT:http-origin='):
-            headers['Origin'] = option[21:].strip()
-        elif option.startswith('#EXTVLCOPT:http-header='):
-            header_line = option[22:].strip()
-            if ':' in header_line:
-                key, value = header_line.split(':', 1)
-                headers[key.strip()] = value.strip()
+        eq_idx = option.find('=')
+        handler = _HEADER_PREFIX_HANDLERS.get(option[:eq_idx + 1]) if eq_idx > 0 else None
+
+        if handler is not None:
+            value = option[eq_idx + 1:].strip()
+            if isinstance(handler, str):
+                headers[handler] = value
+            else:
+                handler(headers, value)
+
         # Generic VLC options format
         elif option.startswith('#EXTVLCOPT:'):
             option_value = option[11:].strip()
             if option_value.startswith('http-'):
-                parts = option_value.split('=', 1)
-                if len(parts) == 2:
-                    header_name = parts[0].replace('http-', '')
-                    # Convert to standard header name
-                    if header_name.lower() == 'user-agent':
-                        header_name = 'User-Agent'
-                    elif header_name.lower() == 'referrer':
-                        header_name = 'Referer'
-                    elif header_name.lower() == 'origin':
-                        header_name = 'Origin'
-                    else:
-                        # Convert header name to standard format (Title-Case)
-                        header_name = '-'.join(word.capitalize() for word in header_name.split('-'))
-                    headers[header_name] = parts[1].strip()
-                
-        # Kodi properties
-        elif option.startswith('#KODIPROP:inputstream.adaptive.stream_headers='):
-            header_part = option[43:].strip()
-            for header_pair in header_part.split('&'):
-                if '=' in header_pair:
-                    key, value = header_pair.split('=', 1)
-                    # Convert common header names to standard format
-                    key = key.strip()
-                    if key.lower() == 'user-agent':
-                        headers['User-Agent'] = value.strip()
-                    elif key.lower() == 'referer' or key.lower() == 'referrer':
-                        headers['Referer'] = value.strip() 
-                    elif key.lower() == 'origin':
-                        headers['Origin'] = value.strip()
-                    else:
-                        # Convert to proper header case
-                        key = '-'.join(word.capitalize() for word in key.split('-'))
-                        headers[key] = value.strip()
+                header_name, sep, value = option_value[5:].partition('=')
+                if sep:
+                    headers[_standard_header_name(header_name)] = value.strip()
         
         # Generic Kodi properties that might contain headers
         elif option.startswith('#KODIPROP:'):
-            if '=' in option:
-                prop, value = option[10:].split('=', 1)
+            prop, sep, value = option[10:].partition('=')
+            if sep:
                 prop = prop.strip().lower()
-                value = value.strip()
-                
-                if prop == 'user-agent':
-                    headers['User-Agent'] = value
-                elif prop in ('referer', 'referrer'):
-                    headers['Referer'] = value
-                elif prop == 'origin':
-                    headers['Origin'] = value
-                elif prop.endswith('.useragent'):
-                    headers['User-Agent'] = value
-                elif prop == 'http-user-agent':
-                    headers['User-Agent'] = value
-                elif prop == 'http-referrer' or prop == 'http-referer':
-                    headers['Referer'] = value
-                elif prop == 'http-origin':
-                    headers['Origin'] = value
+                header_name = _KODI_PROP_HEADERS.get(prop)
+                if header_name is None and prop.endswith('.useragent'):
+                    header_name = 'User-Agent'
+                if header_name:
+                    headers[header_name] = value.strip()
         
-        # Check for headers in the EXTINF line (common in some playlists)
+        # Check for headers in the EXTINF line, the first occurrence of each header wins
         elif option.startswith('#EXTINF:'):
-            # Extract User-Agent
-            if 'user-agent=' in option_lower:
-                ua_start = option_lower.find('user-agent=')
-                if ua_start > 0:
-                    ua_part = option[ua_start + 11:]
-                    # Extract the user agent value (might be quoted or up to next space or comma)
-                    if ua_part.startswith('"'):
-                        end_quote = ua_part.find('"', 1)
-                        if end_quote > 0:
-                            headers['User-Agent'] = ua_part[1:end_quote]
-                    elif ' ' in ua_part:
-                        headers['User-Agent'] = ua_part.split(' ', 1)[0]
-                    elif ',' in ua_part:
-                        headers['User-Agent'] = ua_part.split(',', 1)[0]
-                    else:
-                        headers['User-Agent'] = ua_part
-            
-            # Extract Referer
-            if 'referrer=' in option_lower or 'referer=' in option_lower:
-                ref_keyword = 'referrer=' if 'referrer=' in option_lower else 'referer='
-                ref_start = option_lower.find(ref_keyword)
-                if ref_start > 0:
-                    ref_part = option[ref_start + len(ref_keyword):]
-                    # Extract the referrer value
-                    if ref_part.startswith('"'):
-                        end_quote = ref_part.find('"', 1)
-                        if end_quote > 0:
-                            headers['Referer'] = ref_part[1:end_quote]
-                    elif ' ' in ref_part:
-                        headers['Referer'] = ref_part.split(' ', 1)[0]
-                    elif ',' in ref_part:
-                        headers['Referer'] = ref_part.split(',', 1)[0]
-                    else:
-                        headers['Referer'] = ref_part
-            
-            # Extract Origin (added)
-            if 'origin=' in option_lower:
-                origin_start = option_lower.find('origin=')
-                if origin_start > 0:
-                    origin_part = option[origin_start + 7:]
-                    if origin_part.startswith('"'):
-                        end_quote = origin_part.find('"', 1)
-                        if end_quote > 0:
-                            headers['Origin'] = origin_part[1:end_quote]
-                    elif ' ' in origin_part:
-                        headers['Origin'] = origin_part.split(' ', 1)[0]
-                    elif ',' in origin_part:
-                        headers['Origin'] = origin_part.split(',', 1)[0]
-                    else:
-                        headers['Origin'] = origin_part
+            extinf_headers = {}
+            for match in _EXTINF_HEADER_RE.finditer(option):
+                value = match.group(2) if match.group(2) is not None else match.group(3)
+                extinf_headers.setdefault(_STANDARD_HEADER_NAMES[match.group(1).lower()], value)
+            headers.update(extinf_headers)
     
     # Simple logging to see what headers were found
     if headers:
-        logging.debug(f"Extracted headers: {headers}")
+        logging.debug("Extracted headers: %s", headers)
     
     return headers
 
@@ -640,17 +830,15 @@ def process_url_list(config_file: str, output_dir: str, num_threads: int, ffmpeg
             
             try:
                 # 尝试下载播放列表
-                response = requests.get(url, timeout=30, verify=False)
+                response = SESSION.get(url, timeout=30)
                 response.raise_for_status()
                 content = response.text
                 
-                # 确保内容是有效的M3U格式
-                if not content.strip().startswith('#EXTM3U'):
-                    content = '#EXTM3U\n' + content
-                
-                # 保存原始播放列表
+                # 保存原始播放列表，确保内容是有效的M3U格式
                 original_path = os.path.join(output_dir, f"original_{filename}")
-                with open(original_path, 'w', encoding='utf-8') as f:
+                with open(original_path, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as f:
+                    if not content.lstrip().startswith('#EXTM3U'):
+                        f.write('#EXTM3U\n')
                     f.write(content)
                 
                 # 处理播放列表